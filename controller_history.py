@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+- Purpose: script queries the ingestion-history store written by SheetUpdater,
+    for audit questions like "what got ingested into folder X last week".
+- Assumes:
+    - virtual environment set up
+    - site-packages `requirements.pth` file adds `gdoc_spreadsheet_extraction` enclosing-directory to sys path.
+    - env var `ASSMNT__HISTORY_DB_PATH` set, or `--db` passed.
+- Usage examples:
+    python ./controller_history.py --pid bdr:123
+    python ./controller_history.py --folder 456 --start 2026-10-12 --end 2026-10-19 --status Ingested
+    python ./controller_history.py --row 7 --json
+"""
+
+import argparse, json, logging, random, sys
+from utility_code import HistoryStore
+
+
+## log config -- queries are read-only; only warnings go to stderr
+logging.basicConfig(
+    level=logging.WARNING,
+    format=u'[%(asctime)s] %(levelname)s [%(module)s-%(funcName)s()::%(lineno)d] %(message)s', datefmt=u'%d/%b/%Y %H:%M:%S' )
+log_identifier = random.randint( 1111, 9999 )  # helps to track log flow
+
+
+## args
+parser = argparse.ArgumentParser( description=u'Query gdoc-spreadsheet ingestion history.' )
+parser.add_argument( u'--db', help=u'sqlite path; defaults to env var ASSMNT__HISTORY_DB_PATH' )
+parser.add_argument( u'--pid', help=u'bdr pid, eg `bdr:123`' )
+parser.add_argument( u'--row', type=int, help=u'spreadsheet row number, as displayed' )
+parser.add_argument( u'--folder', help=u'folder id' )
+parser.add_argument( u'--start', help=u'inclusive; `YYYY-MM-DD` or `YYYY-MM-DD HH:MM:SS`' )
+parser.add_argument( u'--end', help=u'exclusive; `YYYY-MM-DD` or `YYYY-MM-DD HH:MM:SS`' )
+parser.add_argument( u'--status', choices=[u'Ingested', u'Error'] )
+parser.add_argument( u'--limit', type=int, default=100 )
+parser.add_argument( u'--json', action=u'store_true', help=u'output json instead of one line per event' )
+args = parser.parse_args()
+
+
+## work
+history_store = HistoryStore( log_identifier, db_path=args.db )
+event_dcts = history_store.query_events(
+    pid=args.pid, row_num=args.row, folder_id=args.folder,
+    start=args.start, end=args.end, status=args.status, limit=args.limit )
+
+if args.json:
+    print( json.dumps(event_dcts, sort_keys=True, indent=2) )
+else:
+    for event_dct in event_dcts:
+        folders = u', '.join( [ u'%s[%s]' % (folder_dct['folder_name'], folder_dct['folder_id']) for folder_dct in event_dct['folders'] ] )
+        line = u'%s | row %s | %s | %s | %s | %s' % (
+            event_dct['timestamp'], event_dct['row_num'], event_dct['status'], event_dct['pid'] or u'-', folders or u'-', event_dct['message'] )
+        print( line.encode(u'utf-8') )
+
+sys.exit()
+
+# [END]
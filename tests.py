@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
-import pprint, unittest
-from gdoc_spreadsheet_extraction.utility_code import SheetGrabber
+import BaseHTTPServer, SocketServer, base64, hashlib, json, os, pprint, shutil, tempfile, threading, time, unittest, urlparse
+from gdoc_spreadsheet_extraction.utility_code import HistoryStore, ResumableUploader, SheetGrabber, SheetUpdater
 
 
 sheet_grabber = SheetGrabber( u'test-identifier' )
@@ -30,6 +30,422 @@ class SheetGrabberTest(unittest.TestCase):
     # end class SheetGrabberTest
 
 
+class HistoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.history_store = HistoryStore( u'test-identifier', db_path=os.path.join(self.temp_dir, u'history.sqlite') )
+        self.history_store.record_event(
+            timestamp=u'2026-10-12 09:00:00', row_num=5, status=u'Error', message=u'file not found',
+            original_data_dct={ u'Title': u'a', u'Location': u'a.pdf', u'Folders': u'Reports[11]' } )
+        self.history_store.record_event(
+            timestamp=u'2026-10-13 09:00:00', row_num=5, status=u'Ingested', message=u'Item ingested', pid=u'bdr:1',
+            original_data_dct={ u'Title': u'a', u'Location': u'a.pdf', u'Folders': u'Reports[11] | Archive[22]' } )
+        self.history_store.record_event(
+            timestamp=u'2026-10-20 09:00:00', row_num=6, status=u'Ingested', message=u'Item ingested', pid=u'bdr:2',
+            original_data_dct={ u'Title': u'b', u'Location': u'b.pdf', u'Folders': u'Archive[22]' } )
+
+    def tearDown(self):
+        self.history_store.connection.close()
+        shutil.rmtree( self.temp_dir )
+
+    def test_query_by_pid(self):
+        event_dcts = self.history_store.query_events( pid=u'bdr:1' )
+        self.assertEqual( 1, len(event_dcts) )
+        self.assertEqual( [u'11', u'22'], sorted([ f['folder_id'] for f in event_dcts[0]['folders'] ]) )
+
+    def test_query_by_row_newest_first(self):
+        event_dcts = self.history_store.query_events( row_num=5 )
+        self.assertEqual( [u'Ingested', u'Error'], [ e['status'] for e in event_dcts ] )
+
+    def test_query_by_folder_and_date(self):
+        event_dcts = self.history_store.query_events( folder_id=u'22', start=u'2026-10-12', end=u'2026-10-19', status=u'Ingested' )
+        self.assertEqual( [u'bdr:1'], [ e['pid'] for e in event_dcts ] )
+
+    def test_parse_folders_skips_malformed(self):
+        self.assertEqual( [(u'Reports', u'11')], self.history_store.parse_folders(u'Reports[11] | bad') )
+
+    def test_record_event_saves_multiline_previous_status(self):
+        legacy_status = u'2026-10-01 09:00:00 -- file not found\n----'
+        event_id = self.history_store.record_event(
+            timestamp=u'2026-10-21 09:00:00', row_num=7, status=u'Error', message=u'file not found',
+            original_data_dct={ u'IngestionStatus': legacy_status } )
+        self.history_store.record_event(
+            timestamp=u'2026-10-22 09:00:00', row_num=7, status=u'Error', message=u'file not found',
+            original_data_dct={ u'IngestionStatus': u'2026-10-21 09:00:00 -- file not found' } )
+        event_dcts = self.history_store.query_events( row_num=7 )
+        self.assertEqual( [None, legacy_status], [ e['previous_status'] for e in event_dcts ] )
+        self.assertEqual( event_id, event_dcts[1]['id'] )
+
+    # end class HistoryStoreTest
+
+
+class FakeCell( object ):
+
+    def __init__( self, value ):
+        self.value = value
+
+
+class FakeWorksheet( object ):
+    """ Stands in for a gspread worksheet; records update_cell() calls. """
+
+    def __init__( self ):
+        self.column_titles = [ u'Title', u'Ready', u'IngestionStatus:' ]
+        self.updates = {}
+
+    def cell( self, row, column ):
+        if row == 1 and column <= len( self.column_titles ):
+            return FakeCell( self.column_titles[column - 1] )
+        return FakeCell( u'' )
+
+    def update_cell( self, row, column, value ):
+        self.updates[ (row, column) ] = value
+
+
+class SheetUpdaterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.original_environ = dict( (key, os.environ.get(key)) for key in ['ASSMNT__HOST_DOMAIN_NAME', 'ASSMNT__HISTORY_DB_PATH'] )
+        os.environ['ASSMNT__HOST_DOMAIN_NAME'] = 'repository.example.edu'
+        os.environ.pop( 'ASSMNT__HISTORY_DB_PATH', None )  # SheetUpdater must still construct without it
+        self.sheet_updater = SheetUpdater( u'test-identifier' )
+        self.sheet_updater.history_store = HistoryStore( u'test-identifier', db_path=os.path.join(self.temp_dir, u'history.sqlite') )
+        self.worksheet = FakeWorksheet()
+        self.legacy_status = u'2026-10-01 09:00:00 -- file not found\n----'
+
+    def tearDown(self):
+        if self.sheet_updater.history_store.connection:
+            self.sheet_updater.history_store.connection.close()
+        shutil.rmtree( self.temp_dir )
+        for ( key, value ) in self.original_environ.items():
+            if value == None:
+                os.environ.pop( key, None )
+            else:
+                os.environ[key] = value
+
+    def test_update_on_success_writes_latest_line_and_history(self):
+        with self.assertRaises( SystemExit ):
+            self.sheet_updater.update_on_success(
+                worksheet=self.worksheet, original_data_dct={ u'IngestionStatus': self.legacy_status, u'Folders': u'Reports[11]' }, row_num=4, pid=u'bdr:1' )
+        cell_message = self.worksheet.updates[ (4, 3) ]
+        self.assertEqual( u'Ingested', self.worksheet.updates[ (4, 2) ] )
+        self.assertEqual( False, u'\n' in cell_message )
+        event_dct = self.sheet_updater.history_store.query_events( pid=u'bdr:1' )[0]
+        self.assertEqual( u'%s -- %s' % (event_dct['timestamp'], event_dct['message']), cell_message )
+        self.assertEqual( self.legacy_status, event_dct['previous_status'] )
+
+    def test_update_on_error_writes_latest_line_and_history(self):
+        with self.assertRaises( Exception ):
+            self.sheet_updater.update_on_error(
+                worksheet=self.worksheet, original_data_dct={ u'IngestionStatus': u'' }, row_num=5, error_data={ u'message': u'file not found' } )
+        event_dct = self.sheet_updater.history_store.query_events( row_num=5 )[0]
+        self.assertEqual( u'Error', self.worksheet.updates[ (5, 2) ] )
+        self.assertEqual( u'%s -- file not found' % event_dct['timestamp'], self.worksheet.updates[ (5, 3) ] )
+
+    def test_history_failure_still_updates_cell_and_keeps_previous_history(self):
+        self.sheet_updater.history_store = HistoryStore( u'test-identifier', db_path=self.temp_dir )  # a directory; sqlite can't open it
+        with self.assertRaises( Exception ):
+            self.sheet_updater.update_on_error(
+                worksheet=self.worksheet, original_data_dct={ u'IngestionStatus': self.legacy_status }, row_num=5, error_data={ u'message': u'file not found' } )
+        cell_message = self.worksheet.updates[ (5, 3) ]
+        self.assertEqual( True, cell_message.endswith(u' -- file not found\n----\n\n%s' % self.legacy_status) )
+
+    def test_unconfigured_history_store_prepends_single_line_status(self):
+        self.sheet_updater.history_store = HistoryStore( u'test-identifier' )  # no db path; env var unset in setUp
+        previous_status = u'2026-10-20 09:00:00 -- file not found'  # written earlier while the store was down
+        with self.assertRaises( Exception ):
+            self.sheet_updater.update_on_error(
+                worksheet=self.worksheet, original_data_dct={ u'IngestionStatus': previous_status }, row_num=5, error_data={ u'message': u'folder not found' } )
+        cell_message = self.worksheet.updates[ (5, 3) ]
+        self.assertEqual( True, cell_message.endswith(u' -- folder not found\n----\n\n%s' % previous_status) )
+
+    # end class SheetUpdaterTest
+
+
+class StandInServer( SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer ):
+    """ Local stand-in for the staging proxy and item-api; injects failures on request. """
+    daemon_threads = True
+
+    def __init__( self, support_staging=True, disconnect_puts=(), corrupt_puts=(), stall_puts=False, hang_puts=(), drop_item_responses=0,
+                  item_delay_seconds=0, drop_complete_connections=0, listening=True ):
+        BaseHTTPServer.HTTPServer.__init__( self, ('127.0.0.1', 0), StandInHandler, bind_and_activate=False )
+        self.server_bind()
+        if listening:  # a bound but non-listening socket refuses connections
+            self.server_activate()
+        self.support_staging = support_staging
+        self.disconnect_puts = disconnect_puts  # 1-based put-numbers to drop halfway through the body
+        self.corrupt_puts = corrupt_puts  # 1-based put-numbers whose body gets a flipped byte in transit
+        self.stall_puts = stall_puts  # acknowledge puts without advancing the offset
+        self.hang_puts = hang_puts  # 1-based put-numbers to read fully and never answer
+        self.drop_item_responses = drop_item_responses  # number of initial item-creations whose response is dropped
+        self.item_delay_seconds = item_delay_seconds  # item-api time to answer once the body is received
+        self.drop_complete_connections = drop_complete_connections  # number of initial complete-posts dropped while forwarding carries on
+        self.uploads = {}
+        self.put_count = 0
+        self.item_post_count = 0
+        self.items_created = 0
+        self.completed_params = None
+        self.base_url = u'http://127.0.0.1:%s/' % self.server_address[1]
+
+
+class StandInHandler( BaseHTTPServer.BaseHTTPRequestHandler ):
+
+    def log_message( self, format, *args ):
+        pass
+
+    def respond( self, status, dct ):
+        body = json.dumps( dct )
+        self.send_response( status )
+        self.send_header( 'Content-Type', 'application/json' )
+        self.send_header( 'Content-Length', str(len(body)) )
+        self.end_headers()
+        self.wfile.write( body )
+
+    def read_body( self, drop_halfway=False ):
+        length = int( self.headers.getheader('Content-Length', 0) )
+        if drop_halfway:
+            self.rfile.read( length / 2 )
+            self.close_connection = 1
+            return None
+        return self.rfile.read( length )
+
+    def get_upload( self ):
+        return self.server.uploads.get( self.path.split('/')[2] )
+
+    def create_item( self ):
+        """ Returns item-api response dct, or None if the response is to be dropped after the item was created. """
+        self.server.items_created += 1
+        if self.server.items_created <= self.server.drop_item_responses:
+            self.close_connection = 1
+            return None
+        return {'post_result': 'SUCCESS', 'pid': 'test:%s' % self.server.items_created}
+
+    def do_POST( self ):
+        if self.path == '/item/':
+            self.server.item_post_count += 1
+            self.read_body()
+            time.sleep( self.server.item_delay_seconds )
+            result = self.create_item()
+            if result != None:
+                self.respond( 200, result )
+        elif not self.server.support_staging:
+            self.read_body()
+            self.respond( 404, {} )
+        elif self.path == '/uploads/':
+            form = urlparse.parse_qs( self.read_body() )
+            upload_id = str( len(self.server.uploads) + 1 )
+            self.server.uploads[upload_id] = { 'data': b'', 'sha256': form['sha256'][0], 'result': None, 'forwarding': False }
+            self.respond( 201, {'upload_id': upload_id} )
+        else:
+            ( upload, params ) = ( self.get_upload(), urlparse.parse_qs(self.read_body()) )
+            if upload == None:
+                self.respond( 404, {} )
+            elif upload['result'] != None:
+                self.respond( 200, upload['result'] )
+            elif upload['forwarding']:  # idempotent per upload_id, including while forwarding
+                self.respond( 202, {} )
+            else:
+                ( self.server.completed_params, upload['forwarding'] ) = ( params, True )
+                if self.server.drop_complete_connections > 0:
+                    self.server.drop_complete_connections -= 1
+                    forward_thread = threading.Thread( target=self.forward_upload, args=(upload,) )
+                    forward_thread.daemon = True
+                    forward_thread.start()
+                    self.close_connection = 1
+                elif not self.forward_upload( upload ):
+                    self.respond( 200, upload['result'] )
+
+    def forward_upload( self, upload ):
+        """ Posts staged upload to the stand-in item-api; returns True if the response is to be dropped. """
+        time.sleep( self.server.item_delay_seconds )
+        dropped = False
+        if hashlib.sha256( upload['data'] ).hexdigest() != upload['sha256']:
+            result = {'post_result': 'FAILURE'}
+        else:
+            result = self.create_item()
+            if result == None:
+                ( result, dropped ) = ( {'post_result': 'SUCCESS', 'pid': 'test:%s' % self.server.items_created}, True )
+        ( upload['result'], upload['forwarding'] ) = ( result, False )
+        return dropped
+
+    def do_GET( self ):
+        upload = self.get_upload()
+        if upload == None:
+            self.respond( 404, {} )
+        elif self.path.endswith( '/complete/' ):
+            if upload['result'] != None:
+                self.respond( 200, upload['result'] )
+            elif upload['forwarding']:
+                self.respond( 202, {} )
+            else:
+                self.respond( 404, {} )
+        else:
+            self.respond( 200, {'offset': len(upload['data'])} )
+
+    def do_PUT( self ):
+        self.server.put_count += 1
+        upload = self.get_upload()
+        body = self.read_body( drop_halfway=(self.server.put_count in self.server.disconnect_puts) )
+        if body == None:
+            return
+        if self.server.put_count in self.server.hang_puts:
+            time.sleep( 1 )
+            self.close_connection = 1
+            return
+        if self.server.put_count in self.server.corrupt_puts:
+            body = chr( ord(body[0]) ^ 1 ) + body[1:]
+        start = int( self.headers.getheader('Content-Range').split(' ')[1].split('-')[0] )
+        if upload == None:
+            self.respond( 404, {} )
+        elif base64.b64encode( hashlib.md5(body).digest() ) != self.headers.getheader('Content-MD5'):
+            self.respond( 400, {'offset': len(upload['data']), 'message': 'checksum mismatch'} )
+        elif start != len( upload['data'] ):
+            self.respond( 409, {'offset': len(upload['data'])} )
+        elif self.server.stall_puts:
+            self.respond( 200, {'offset': len(upload['data'])} )
+        else:
+            upload['data'] += body
+            self.respond( 200, {'offset': len(upload['data'])} )
+
+
+class ResumableUploaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filepath = os.path.join( self.temp_dir, u'test.bin' )
+        self.file_bytes = os.urandom( 10 * 1024 + 17 )  # 11 chunks at 1 KB
+        with open( self.filepath, 'wb' ) as f:
+            f.write( self.file_bytes )
+        self.history_store = HistoryStore( u'test-identifier', db_path=os.path.join(self.temp_dir, u'history.sqlite') )
+        self.server = None
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.history_store.connection:
+            self.history_store.connection.close()
+        shutil.rmtree( self.temp_dir )
+
+    def start_server(self, listen_after_seconds=None, **kwargs):
+        self.server = StandInServer( listening=(listen_after_seconds == None), **kwargs )
+        def serve():
+            if listen_after_seconds != None:
+                time.sleep( listen_after_seconds )
+                self.server.server_activate()
+            self.server.serve_forever()
+        thread = threading.Thread( target=serve )
+        thread.daemon = True
+        thread.start()
+
+    def make_uploader(self, staging=True, max_attempts=3, backoff_seconds=0, timeout_seconds=5):
+        staging_url = u'%suploads/' % self.server.base_url if staging else None
+        return ResumableUploader(
+            u'test-identifier', staging_url=staging_url, chunk_size=1024, max_attempts=max_attempts,
+            backoff_seconds=backoff_seconds, timeout_seconds=timeout_seconds, poll_seconds=0.1, history_store=self.history_store )
+
+    def post_item(self, uploader):
+        return uploader.post_item( u'%sitem/' % self.server.base_url, {u'identity': u'x'}, self.filepath )
+
+    def test_staged_upload_resumes_after_disconnects(self):
+        self.start_server( disconnect_puts=(3, 8) )
+        r = self.post_item( self.make_uploader() )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( self.file_bytes, self.server.uploads['1']['data'] )
+        self.assertEqual( [u'x'], self.server.completed_params['identity'] )
+        self.assertEqual( 13, self.server.put_count )  # 11 chunks + 2 re-sent; not the whole file again
+        self.assertEqual( 0, self.server.item_post_count )
+
+    def test_staged_upload_resends_chunk_on_checksum_mismatch(self):
+        self.start_server( corrupt_puts=(2,) )
+        r = self.post_item( self.make_uploader() )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( self.file_bytes, self.server.uploads['1']['data'] )
+        self.assertEqual( 12, self.server.put_count )
+
+    def test_staged_upload_gives_up_after_max_attempts(self):
+        self.start_server( disconnect_puts=(2, 3, 4) )
+        with self.assertRaises( Exception ):
+            self.post_item( self.make_uploader(max_attempts=3) )
+
+    def test_stalled_offset_uses_up_attempts(self):
+        self.start_server( stall_puts=True )
+        with self.assertRaises( Exception ):
+            self.post_item( self.make_uploader(max_attempts=3) )
+        self.assertEqual( 3, self.server.put_count )
+
+    def test_hung_chunk_times_out_and_resumes(self):
+        self.start_server( hang_puts=(2,) )
+        r = self.post_item( self.make_uploader(timeout_seconds=0.3) )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( self.file_bytes, self.server.uploads['1']['data'] )
+        self.assertEqual( 12, self.server.put_count )
+
+    def test_lost_complete_response_creates_one_item(self):
+        self.start_server( drop_item_responses=1 )
+        r = self.post_item( self.make_uploader() )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( 1, self.server.items_created )
+
+    def test_slow_complete_forward_creates_one_item(self):
+        self.start_server( item_delay_seconds=1 )
+        r = self.post_item( self.make_uploader(timeout_seconds=0.3) )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( 1, self.server.items_created )
+
+    def test_dropped_complete_polls_in_flight_forward_and_creates_one_item(self):
+        self.start_server( item_delay_seconds=0.5, drop_complete_connections=1 )
+        r = self.post_item( self.make_uploader(timeout_seconds=0.3) )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( u'test:1', r.json()['pid'] )
+        self.assertEqual( 1, self.server.items_created )
+
+    def test_saved_upload_resumes_on_next_run(self):
+        self.start_server( disconnect_puts=(4, 5) )
+        with self.assertRaises( Exception ):
+            self.post_item( self.make_uploader(max_attempts=2) )  # first run gives up after 3 chunks
+        r = self.post_item( self.make_uploader() )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( [u'1'], self.server.uploads.keys() )
+        self.assertEqual( self.file_bytes, self.server.uploads['1']['data'] )
+        self.assertEqual( 13, self.server.put_count )  # 5 on first run, 8 on second
+        sha256 = hashlib.sha256( self.file_bytes ).hexdigest()
+        self.assertEqual( None, self.history_store.get_upload_id(self.filepath, sha256) )  # forgotten once completed
+
+    def test_saved_upload_unknown_to_proxy_starts_new_upload(self):
+        self.start_server()
+        self.history_store.save_upload_id( self.filepath, hashlib.sha256(self.file_bytes).hexdigest(), u'99' )
+        r = self.post_item( self.make_uploader() )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( self.file_bytes, self.server.uploads['1']['data'] )
+
+    def test_falls_back_to_whole_file_when_staging_unsupported(self):
+        self.start_server( support_staging=False )
+        r = self.post_item( self.make_uploader() )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( 1, self.server.item_post_count )
+
+    def test_whole_file_retried_when_connection_refused(self):
+        self.start_server( listen_after_seconds=0.1 )
+        r = self.post_item( self.make_uploader(staging=False, backoff_seconds=0.3) )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( 1, self.server.item_post_count )
+
+    def test_whole_file_waits_for_slow_item_api(self):
+        self.start_server( item_delay_seconds=1 )
+        r = self.post_item( self.make_uploader(staging=False, timeout_seconds=0.3) )
+        self.assertEqual( u'SUCCESS', r.json()['post_result'] )
+        self.assertEqual( 1, self.server.items_created )
+
+    def test_whole_file_not_resent_after_response_lost(self):
+        self.start_server( drop_item_responses=1 )
+        with self.assertRaises( Exception ):
+            self.post_item( self.make_uploader(staging=False) )
+        self.assertEqual( 1, self.server.items_created )
+
+    # end class ResumableUploaderTest
+
+
 
 
 if __name__ == '__main__':
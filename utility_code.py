@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import datetime, json, logging, os, pprint, sys
+import base64, datetime, errno, hashlib, json, logging, os, pprint, socket, sqlite3, sys, time
 import gspread,requests
 from oauth2client.client import SignedJwtAssertionCredentials
 
@@ -19,6 +19,7 @@ class SheetUpdater( object ):
         self.ingestion_status_column_name = u'IngestionStatus'
         self.ready_column_int = None
         self.ingestion_status_column_int = None
+        self.history_store = HistoryStore( log_identifier )
 
     def update_on_success( self, worksheet, original_data_dct, row_num, pid ):
         """ Updates ready-column and message column.
@@ -28,7 +29,10 @@ class SheetUpdater( object ):
         self.ingestion_status_column_int = self.get_column_int( worksheet, self.ingestion_status_column_name )
         worksheet.update_cell(
             row_num, self.ready_column_int, u'Ingested' )
-        new_message = self.make_new_success_message( original_data_dct, pid )
+        ( now, message ) = ( self.make_timestamp(), self.make_success_message(pid) )
+        event_id = self.history_store.record_event(
+            timestamp=now, row_num=row_num, status=u'Ingested', message=message, original_data_dct=original_data_dct, pid=pid )
+        new_message = self.keep_previous_if_unrecorded( self.make_new_success_message(now, message), original_data_dct, event_id )
         worksheet.update_cell(
             row_num, self.ingestion_status_column_int, new_message )
         log.info( u'%s -- ending script' % self.log_identifier )
@@ -42,7 +46,10 @@ class SheetUpdater( object ):
         self.ingestion_status_column_int = self.get_column_int( worksheet, self.ingestion_status_column_name )
         worksheet.update_cell(
             row_num, self.ready_column_int, u'Error' )
-        new_message = self.make_new_error_message( original_data_dct, error_data )
+        now = self.make_timestamp()
+        event_id = self.history_store.record_event(
+            timestamp=now, row_num=row_num, status=u'Error', message=error_data['message'], original_data_dct=original_data_dct, pid=None )
+        new_message = self.keep_previous_if_unrecorded( self.make_new_error_message(now, error_data), original_data_dct, event_id )
         worksheet.update_cell(
             row_num, self.ingestion_status_column_int, new_message )
         log.info( u'%s -- raising exception' % self.log_identifier )
@@ -63,34 +70,214 @@ class SheetUpdater( object ):
             raise Exception( error_message )
         return column_int
 
-    def make_new_success_message( self, original_data_dct, pid ):
-        """ Adds date-stamped new success message containing bdr-link to beginning of old message & returns it.
+    def make_timestamp( self ):
+        """ Returns `YYYY-MM-DD HH:MM:SS` string used for both the sheet message and the history store.
+            Called by update_on_success() and update_on_error() """
+        return unicode( datetime.datetime.now() )[0:19]
+
+    def make_success_message( self, pid ):
+        """ Returns success message containing bdr-link.
             Called by update_on_success() """
-        previous_message = original_data_dct['IngestionStatus']
-        now = unicode( datetime.datetime.now() )[0:19]
-        message = u'Item ingested, and is accessable at https://%s/studio/item/%s/' % ( self.HOST_DOMAIN_NAME, pid )
-        if previous_message == None or len( previous_message.strip() ) == 0:
-            new_message = u'%s -- %s\n----' % ( now, message )
-        else:
-            new_message = u'%s -- %s\n----\n\n%s' % ( now, message, previous_message )
+        return u'Item ingested, and is accessable at https://%s/studio/item/%s/' % ( self.HOST_DOMAIN_NAME, pid )
+
+    def make_new_success_message( self, now, message ):
+        """ Returns date-stamped latest-status success message.
+            Earlier messages are no longer prepended; full history lives in the HistoryStore.
+            Called by update_on_success() """
+        new_message = u'%s -- %s' % ( now, message )
         log.debug( u'%s -- new_message, `%s`' % (self.log_identifier, new_message) )
         return new_message
 
-    def make_new_error_message( self, original_data_dct, error_data ):
-        """ Adds date-stamped new error message to beginning of old message & returns it.
+    def make_new_error_message( self, now, error_data ):
+        """ Returns date-stamped latest-status error message.
+            Earlier messages are no longer prepended; full history lives in the HistoryStore.
             Called by update_on_error() """
-        previous_message = original_data_dct['IngestionStatus']
-        now = unicode( datetime.datetime.now() )[0:19]
-        if previous_message == None or len( previous_message.strip() ) == 0:
-            new_message = u'%s -- %s\n----' % ( now, error_data['message'] )
-        else:
-            new_message = u'%s -- %s\n----\n\n%s' % ( now, error_data['message'], previous_message )
+        new_message = u'%s -- %s' % ( now, error_data['message'] )
         log.debug( u'%s -- new_message, `%s`' % (self.log_identifier, new_message) )
         return new_message
 
+    def keep_previous_if_unrecorded( self, new_message, original_data_dct, event_id ):
+        """ Returns new_message, or -- if the history store couldn't record the event -- new_message prepended to any
+              existing cell text, as before the history store existed, so unrecorded history isn't overwritten.
+            Called by update_on_success() and update_on_error() """
+        previous_status = ( original_data_dct.get('IngestionStatus') or u'' ).strip()
+        if event_id == None and previous_status:
+            new_message = u'%s\n----\n\n%s' % ( new_message, previous_status )
+            log.warning( u'%s -- history not recorded; keeping previous cell history' % self.log_identifier )
+        return new_message
+
     # end class SheetUpdater
 
 
+class HistoryStore( object ):
+    """ Manages the sqlite ingestion-history store.
+        One row per ingestion event, plus one row per (event, folder) so folder queries can use an index. """
+
+    def __init__( self, log_identifier, db_path=None ):
+        self.log_identifier = log_identifier
+        self.DB_PATH = db_path or os.environ.get( 'ASSMNT__HISTORY_DB_PATH' )
+        self.connection = None
+
+    def get_connection( self ):
+        """ Opens connection and ensures schema on first use.
+            Raises if no db path is configured; callers that mustn't block ingestion catch this. """
+        if self.connection == None:
+            if not self.DB_PATH:
+                raise Exception( u'history store unavailable; env var ASSMNT__HISTORY_DB_PATH not set' )
+            self.connection = sqlite3.connect( self.DB_PATH )
+            self.connection.row_factory = sqlite3.Row
+            self.create_schema()
+        return self.connection
+
+    def create_schema( self ):
+        """ Creates tables and indexes if they don't exist.
+            Called by get_connection() """
+        self.connection.executescript( u'''
+            CREATE TABLE IF NOT EXISTS ingestion_event (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                row_num INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                pid TEXT,
+                title TEXT,
+                file_path TEXT,
+                message TEXT,
+                log_identifier TEXT,
+                previous_status TEXT );
+            CREATE TABLE IF NOT EXISTS ingestion_event_folder (
+                event_id INTEGER NOT NULL REFERENCES ingestion_event(id),
+                folder_id TEXT NOT NULL,
+                folder_name TEXT );
+            CREATE INDEX IF NOT EXISTS ingestion_event_pid_idx ON ingestion_event (pid);
+            CREATE INDEX IF NOT EXISTS ingestion_event_row_num_idx ON ingestion_event (row_num, timestamp);
+            CREATE INDEX IF NOT EXISTS ingestion_event_timestamp_idx ON ingestion_event (timestamp);
+            CREATE INDEX IF NOT EXISTS ingestion_event_folder_idx ON ingestion_event_folder (folder_id, event_id);
+            CREATE TABLE IF NOT EXISTS upload_session (
+                file_path TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                upload_id TEXT NOT NULL,
+                created TEXT NOT NULL,
+                PRIMARY KEY (file_path, sha256) );
+            ''' )
+        column_names = [ row['name'] for row in self.connection.execute(u'PRAGMA table_info(ingestion_event)') ]
+        if u'previous_status' not in column_names:  # store created before previous_status was added
+            self.connection.execute( u'ALTER TABLE ingestion_event ADD COLUMN previous_status TEXT' )
+        return
+
+    def parse_folders( self, folders_cell ):
+        """ Returns list of (folder_name, folder_id) tuples from a `name[id] | name2[id2]` cell; skips malformed entries.
+            Called by record_event() """
+        folder_tuples = []
+        for entry in ( folders_cell or u'' ).split( u' | ' ):
+            entry = entry.strip()
+            if entry.count( u'[' ) == 1 and entry.endswith( u']' ):
+                ( folder_name, folder_id ) = entry[0:-1].split( u'[' )
+                folder_tuples.append( (folder_name, folder_id) )
+        return folder_tuples
+
+    def get_previous_status( self, original_data_dct ):
+        """ Returns the cell's existing IngestionStatus text if it holds multi-line, pre-history-store history; otherwise None.
+            Called by record_event() and SheetUpdater.keep_previous_if_unrecorded() """
+        previous_status = ( original_data_dct.get('IngestionStatus') or u'' ).strip()
+        if u'\n' in previous_status:
+            return previous_status
+        return None
+
+    def record_event( self, timestamp, row_num, status, message, original_data_dct, pid=None ):
+        """ Inserts ingestion event and its folders; returns event id, or None on failure.
+            Multi-line cell history about to be overwritten is saved in `previous_status`.
+            A history-store failure is logged but never blocks the spreadsheet update.
+            Called by SheetUpdater.update_on_success() and SheetUpdater.update_on_error() """
+        try:
+            connection = self.get_connection()
+            with connection:
+                cursor = connection.execute(
+                    u'INSERT INTO ingestion_event (timestamp, row_num, status, pid, title, file_path, message, log_identifier, previous_status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    ( timestamp, row_num, status, pid, original_data_dct.get('Title'), original_data_dct.get('Location'), message, unicode(self.log_identifier), self.get_previous_status(original_data_dct) ) )
+                event_id = cursor.lastrowid
+                for ( folder_name, folder_id ) in self.parse_folders( original_data_dct.get('Folders') ):
+                    connection.execute(
+                        u'INSERT INTO ingestion_event_folder (event_id, folder_id, folder_name) VALUES (?, ?, ?)',
+                        ( event_id, folder_id, folder_name ) )
+            log.debug( u'%s -- history event_id, `%s`' % (self.log_identifier, event_id) )
+            return event_id
+        except Exception as e:
+            log.error( u'%s -- exception recording history, `%s`' % (self.log_identifier, unicode(repr(e))) )
+            return None
+
+    def query_events( self, pid=None, row_num=None, folder_id=None, start=None, end=None, status=None, limit=100 ):
+        """ Returns list of event dcts, newest first, matching all given filters.
+            `start` is inclusive and `end` is exclusive; both are `YYYY-MM-DD` or `YYYY-MM-DD HH:MM:SS` strings.
+            Called by controller_history.py """
+        ( clauses, params ) = ( [], [] )
+        if pid:
+            clauses.append( u'e.pid = ?' )
+            params.append( pid )
+        if row_num:
+            clauses.append( u'e.row_num = ?' )
+            params.append( int(row_num) )
+        if folder_id:
+            clauses.append( u'e.id IN (SELECT event_id FROM ingestion_event_folder WHERE folder_id = ?)' )
+            params.append( folder_id )
+        if start:
+            clauses.append( u'e.timestamp >= ?' )
+            params.append( start )
+        if end:
+            clauses.append( u'e.timestamp < ?' )
+            params.append( end )
+        if status:
+            clauses.append( u'e.status = ?' )
+            params.append( status )
+        sql = u'SELECT e.* FROM ingestion_event e'
+        if clauses:
+            sql = u'%s WHERE %s' % ( sql, u' AND '.join(clauses) )
+        sql = u'%s ORDER BY e.timestamp DESC, e.id DESC LIMIT ?' % sql
+        params.append( int(limit) )
+        connection = self.get_connection()
+        event_dcts = [ dict(row) for row in connection.execute(sql, params) ]
+        for event_dct in event_dcts:
+            event_dct['folders'] = [ dict(row) for row in connection.execute(
+                u'SELECT folder_id, folder_name FROM ingestion_event_folder WHERE event_id = ?', (event_dct['id'],) ) ]
+        log.debug( u'%s -- event_dcts, `%s`' % (self.log_identifier, pprint.pformat(event_dcts)) )
+        return event_dcts
+
+    def get_upload_id( self, file_path, sha256 ):
+        """ Returns staging-proxy upload_id saved for this file-content, or None.
+            A history-store failure is logged and treated as no saved upload.
+            Called by ResumableUploader.find_saved_upload() """
+        try:
+            row = self.get_connection().execute(
+                u'SELECT upload_id FROM upload_session WHERE file_path = ? AND sha256 = ?', (file_path, sha256) ).fetchone()
+            return row['upload_id'] if row else None
+        except Exception as e:
+            log.error( u'%s -- exception getting upload_id, `%s`' % (self.log_identifier, unicode(repr(e))) )
+            return None
+
+    def save_upload_id( self, file_path, sha256, upload_id ):
+        """ Saves staging-proxy upload_id so a later run can resume the upload.
+            Called by ResumableUploader.post_staged() """
+        try:
+            with self.get_connection() as connection:
+                connection.execute(
+                    u'INSERT OR REPLACE INTO upload_session (file_path, sha256, upload_id, created) VALUES (?, ?, ?, ?)',
+                    ( file_path, sha256, upload_id, unicode(datetime.datetime.now())[0:19] ) )
+        except Exception as e:
+            log.error( u'%s -- exception saving upload_id, `%s`' % (self.log_identifier, unicode(repr(e))) )
+        return
+
+    def delete_upload_id( self, file_path, sha256 ):
+        """ Forgets saved upload_id once the upload is completed or unknown to the proxy.
+            Called by ResumableUploader.post_staged() and ResumableUploader.find_saved_upload() """
+        try:
+            with self.get_connection() as connection:
+                connection.execute( u'DELETE FROM upload_session WHERE file_path = ? AND sha256 = ?', (file_path, sha256) )
+        except Exception as e:
+            log.error( u'%s -- exception deleting upload_id, `%s`' % (self.log_identifier, unicode(repr(e))) )
+        return
+
+    # end class HistoryStore
+
+
 class Validator( object ):
     """ Manages validation. """
 
@@ -471,7 +658,234 @@ class SheetGrabber( object ):
     # end class SheetGrabber
 
 
-def ingestItem(validity_result_list):
+class ResumableUploader( object ):
+    """ Posts an item's file with retry-and-backoff.
+        If env var `ASSMNT__UPLOAD_STAGING_URL` is set, sends the file to that staging proxy in checksummed chunks,
+          resuming from the proxy's last acknowledged offset after a failure, then asks the proxy to forward the item to the item-api.
+          Given a HistoryStore, the upload_id is saved by file path and sha256, so a later run resumes rather than re-sending every byte.
+        Otherwise, or if the proxy doesn't support uploads, posts the whole file to the item-api.
+        Item-creating posts are never blindly repeated: the whole-file post is re-sent only if the connection was never made,
+          and the complete-post is re-sent only after the proxy confirms the upload has neither completed nor started forwarding.
+        Staging-proxy protocol:
+          - POST <staging_url>                       data: file_name, total_size, sha256  -> {'upload_id': '...'}
+          - GET  <staging_url><upload_id>/                                                -> {'offset': n}  (404 if unknown/expired)
+          - PUT  <staging_url><upload_id>/           headers: Content-Range, Content-MD5  -> {'offset': n}  (400 on checksum mismatch)
+          - GET  <staging_url><upload_id>/complete/                                       -> stored item-api response  (202 while forwarding; 404 if not started)
+          - POST <staging_url><upload_id>/complete/  data: item-api params                -> item-api response  (202, without forwarding again, if already forwarding)
+        Item-creating posts get only a connect timeout: the item-api may take a long time to answer after receiving a large file,
+          and giving up on a read would report an error for an item that exists. """
+
+    RETRYABLE_STATUS_CODES = [ 500, 502, 503, 504 ]  # only for requests that don't create items
+    UNSUPPORTED_STATUS_CODES = [ 404, 405, 501 ]
+    CONNECT_ERRNOS = [ errno.ECONNREFUSED, errno.ENETUNREACH, errno.EHOSTUNREACH ]  # request can't have reached the server
+
+    def __init__( self, log_identifier, staging_url=None, chunk_size=None, max_attempts=None, backoff_seconds=None, timeout_seconds=None,
+                  poll_seconds=None, complete_wait_seconds=None, history_store=None ):
+        self.log_identifier = log_identifier
+        self.STAGING_URL = staging_url or os.environ.get( 'ASSMNT__UPLOAD_STAGING_URL' )  # should contain trailing slash
+        self.CHUNK_SIZE = chunk_size or int( os.environ.get('ASSMNT__UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024) )
+        self.MAX_ATTEMPTS = max_attempts or int( os.environ.get('ASSMNT__UPLOAD_MAX_ATTEMPTS', 5) )
+        self.BACKOFF_SECONDS = float( os.environ.get('ASSMNT__UPLOAD_BACKOFF_SECONDS', 2) ) if backoff_seconds == None else backoff_seconds
+        self.TIMEOUT_SECONDS = timeout_seconds or float( os.environ.get('ASSMNT__UPLOAD_TIMEOUT_SECONDS', 60) )  # connect, and each read of non-item-creating requests
+        self.POLL_SECONDS = poll_seconds or float( os.environ.get('ASSMNT__UPLOAD_POLL_SECONDS', 10) )  # while proxy is forwarding to item-api
+        self.COMPLETE_WAIT_SECONDS = complete_wait_seconds or float( os.environ.get('ASSMNT__UPLOAD_COMPLETE_WAIT_SECONDS', 3600) )
+        self.history_store = history_store  # optional; persists upload_ids across runs
+        self.failures = 0  # consecutive; reset whenever an upload makes progress
+
+    def post_item( self, url, params, filepath ):
+        """ Returns the item-api response.
+            Called by ingestItem() """
+        self.failures = 0
+        if self.STAGING_URL:
+            r = self.post_staged( params, filepath )
+            if r != None:
+                return r
+            log.info( u'%s -- staging proxy does not support uploads; falling back to whole-file post' % self.log_identifier )
+        return self.post_whole_file( url, params, filepath )
+
+    def post_whole_file( self, url, params, filepath ):
+        """ Posts file and params to item-api, re-sending only if the connection was never made.
+            Any other failure is raised, since the item-api may already have created the item.
+            Called by post_item() """
+        while True:
+            try:
+                with open( filepath, 'rb' ) as f:
+                    return requests.post( url, data=params, files={ os.path.basename(filepath): f }, verify=True, timeout=(self.TIMEOUT_SECONDS, None) )
+            except requests.exceptions.RequestException as e:
+                if not self.is_connect_failure( e ):
+                    raise
+                self.handle_failure( u'whole-file post could not connect, `%s`' % unicode(repr(e)) )
+
+    def is_connect_failure( self, exception ):
+        """ Returns True if the exception shows the request never reached the server.
+            requests wraps the underlying socket error a few levels deep, so the exception chain is walked.
+            Called by post_whole_file() """
+        if isinstance( exception, requests.exceptions.ConnectTimeout ):
+            return True
+        causes = [ exception ]
+        while causes:
+            cause = causes.pop()
+            if isinstance( cause, socket.gaierror ) or ( isinstance(cause, socket.error) and cause.errno in self.CONNECT_ERRNOS ):
+                return True
+            causes.extend( [ arg for arg in getattr(cause, 'args', ()) if isinstance(arg, BaseException) ] )
+            if isinstance( getattr(cause, 'reason', None), BaseException ):
+                causes.append( cause.reason )
+        return False
+
+    def post_staged( self, params, filepath ):
+        """ Sends file to staging proxy in chunks, then has the proxy post params and file to the item-api.
+            Returns None if the proxy doesn't support uploads.
+            Called by post_item() """
+        ( total_size, sha256 ) = ( os.path.getsize(filepath), self.make_file_sha256(filepath) )
+        ( upload_url, offset ) = self.find_saved_upload( filepath, sha256 )
+        if upload_url == None:
+            upload_id = self.create_upload( filepath, total_size, sha256 )
+            if upload_id == None:
+                return None
+            ( upload_url, offset ) = ( u'%s%s/' % (self.STAGING_URL, upload_id), 0 )
+            if self.history_store:
+                self.history_store.save_upload_id( filepath, sha256, upload_id )
+        with open( filepath, 'rb' ) as f:
+            while offset < total_size:
+                try:
+                    offset = self.send_chunk( upload_url, f, offset, total_size )
+                except Exception as e:
+                    self.handle_failure( u'chunk at offset `%s` failed, `%s`' % (offset, unicode(repr(e))) )
+                    offset = self.get_acknowledged_offset( upload_url )
+                    if offset == None:
+                        raise Exception( u'upload `%s` no longer known to staging proxy' % upload_url )
+        log.info( u'%s -- staged `%s` bytes at, `%s`' % (self.log_identifier, total_size, upload_url) )
+        r = self.complete_upload( upload_url, params )
+        if r.ok and self.history_store:
+            self.history_store.delete_upload_id( filepath, sha256 )
+        return r
+
+    def find_saved_upload( self, filepath, sha256 ):
+        """ Returns ( upload_url, acknowledged_offset ) for an upload saved by an earlier run, or ( None, 0 ).
+            A saved upload_id the proxy no longer knows is forgotten, so a new upload gets created.
+            Called by post_staged() """
+        upload_id = self.history_store.get_upload_id( filepath, sha256 ) if self.history_store else None
+        if upload_id == None:
+            return ( None, 0 )
+        upload_url = u'%s%s/' % ( self.STAGING_URL, upload_id )
+        offset = self.get_acknowledged_offset( upload_url )
+        if offset == None:
+            log.info( u'%s -- saved upload_id `%s` unknown to staging proxy; starting new upload' % (self.log_identifier, upload_id) )
+            self.history_store.delete_upload_id( filepath, sha256 )
+            return ( None, 0 )
+        log.info( u'%s -- resuming saved upload_id `%s` at offset, `%s`' % (self.log_identifier, upload_id, offset) )
+        return ( upload_url, offset )
+
+    def create_upload( self, filepath, total_size, sha256 ):
+        """ Starts an upload session on the staging proxy; returns upload_id, or None if unsupported.
+            Called by post_staged() """
+        data = { u'file_name': os.path.basename(filepath), u'total_size': total_size, u'sha256': sha256 }
+        while True:
+            try:
+                r = requests.post( self.STAGING_URL, data=data, verify=True, timeout=self.TIMEOUT_SECONDS )
+                if r.status_code in self.UNSUPPORTED_STATUS_CODES:
+                    return None
+                if r.ok:
+                    upload_id = r.json()['upload_id']
+                    log.debug( u'%s -- upload_id, `%s`' % (self.log_identifier, upload_id) )
+                    return upload_id
+                self.handle_failure( u'create-upload status, `%s`' % r.status_code )
+            except requests.exceptions.RequestException as e:
+                self.handle_failure( u'create-upload exception, `%s`' % unicode(repr(e)) )
+
+    def send_chunk( self, upload_url, f, offset, total_size ):
+        """ Sends chunk starting at offset; returns new acknowledged offset.
+            Raises if the proxy doesn't advance the offset, so a stalled proxy uses up attempts instead of looping.
+            Called by post_staged() """
+        f.seek( offset )
+        chunk = f.read( self.CHUNK_SIZE )
+        headers = {
+            u'Content-Range': u'bytes %s-%s/%s' % ( offset, offset + len(chunk) - 1, total_size ),
+            u'Content-MD5': base64.b64encode( hashlib.md5(chunk).digest() ),
+            u'Content-Type': u'application/octet-stream' }
+        r = requests.put( upload_url, data=chunk, headers=headers, verify=True, timeout=self.TIMEOUT_SECONDS )
+        if not r.ok:
+            raise Exception( u'chunk rejected: %s - %s' % (r.status_code, r.content) )
+        new_offset = int( r.json()['offset'] )
+        if new_offset <= offset:
+            raise Exception( u'staging proxy did not advance offset past `%s`' % offset )
+        self.failures = 0
+        return new_offset
+
+    def get_acknowledged_offset( self, upload_url ):
+        """ Returns proxy's last acknowledged offset, or None if the proxy doesn't know the upload; retries with backoff.
+            Called by post_staged() and find_saved_upload() """
+        while True:
+            try:
+                r = requests.get( upload_url, verify=True, timeout=self.TIMEOUT_SECONDS )
+                if r.status_code == 404:
+                    return None
+                if r.ok:
+                    offset = int( r.json()['offset'] )
+                    log.info( u'%s -- acknowledged offset, `%s`' % (self.log_identifier, offset) )
+                    return offset
+                self.handle_failure( u'offset-check status, `%s`' % r.status_code )
+            except requests.exceptions.RequestException as e:
+                self.handle_failure( u'offset-check exception, `%s`' % unicode(repr(e)) )
+
+    def complete_upload( self, upload_url, params ):
+        """ Returns item-api response for the upload.
+            Before every complete-post, asks the proxy for the upload's completion state: a stored response -- eg when an
+              earlier response was lost -- is returned; while the proxy is still forwarding, polls instead of posting again.
+            Raises if forwarding takes longer than COMPLETE_WAIT_SECONDS; the saved upload_id lets a later run pick up the result.
+            Called by post_staged() """
+        ( complete_url, wait_until ) = ( u'%scomplete/' % upload_url, time.time() + self.COMPLETE_WAIT_SECONDS )
+        while True:
+            try:
+                r = requests.get( complete_url, verify=True, timeout=self.TIMEOUT_SECONDS )
+                if r.status_code == 202:
+                    self.wait_for_forward( wait_until )
+                    continue
+                if r.ok:
+                    log.info( u'%s -- upload already completed; using stored response' % self.log_identifier )
+                    return r
+                if r.status_code in self.RETRYABLE_STATUS_CODES:
+                    self.handle_failure( u'complete-check status, `%s`' % r.status_code )
+                    continue
+                r = requests.post( complete_url, data=params, verify=True, timeout=(self.TIMEOUT_SECONDS, None) )
+                if r.status_code != 202:
+                    return r
+                self.wait_for_forward( wait_until )
+            except requests.exceptions.RequestException as e:
+                self.handle_failure( u'complete exception, `%s`' % unicode(repr(e)) )
+
+    def wait_for_forward( self, wait_until ):
+        """ Sleeps one poll-interval while the proxy forwards the upload to the item-api; raises once wait_until has passed.
+            Called by complete_upload() """
+        if time.time() >= wait_until:
+            raise Exception( u'staging proxy still forwarding upload after `%s` seconds' % self.COMPLETE_WAIT_SECONDS )
+        log.info( u'%s -- staging proxy still forwarding upload; polling' % self.log_identifier )
+        time.sleep( self.POLL_SECONDS )
+        return
+
+    def make_file_sha256( self, filepath ):
+        """ Returns hex sha256 of file, read in chunks so large files aren't loaded into memory.
+            Called by post_staged() """
+        sha = hashlib.sha256()
+        with open( filepath, 'rb' ) as f:
+            for chunk in iter( lambda: f.read(self.CHUNK_SIZE), b'' ):
+                sha.update( chunk )
+        return sha.hexdigest()
+
+    def handle_failure( self, message ):
+        """ Logs failure; raises once max-attempts is reached, otherwise sleeps with exponential backoff.
+            Called on every failed request. """
+        self.failures += 1
+        log.warning( u'%s -- upload failure `%s` of `%s`; %s' % (self.log_identifier, self.failures, self.MAX_ATTEMPTS, message) )
+        if self.failures >= self.MAX_ATTEMPTS:
+            raise Exception( u'upload failed after `%s` attempts; last failure: %s' % (self.failures, message) )
+        time.sleep( min(self.BACKOFF_SECONDS * 2 ** (self.failures - 1), 60) )
+        return
+
+    # end class ResumableUploader
+
+
+def ingestItem(validity_result_list, log_identifier=None):
     """ Posts data to item-api
         Called by controller.
         validity_result_list = [
@@ -481,6 +895,7 @@ def ingestItem(validity_result_list):
             vresult_keywords, vresult_title
         ]
         each vresult*: {'parameter_label': '...', 'normalized_cell_data': '...'}
+        File is sent via ResumableUploader, which retries and, given a staging proxy, resumes interrupted uploads across runs.
         """
     URL = os.environ['ASSMNT__ITEM_API_URL']
     IDENTITY = os.environ['ASSMNT__ITEM_API_IDENTITY']
@@ -504,11 +919,9 @@ def ingestItem(validity_result_list):
                 mods_parameters[ entry[u'parameter_label'] ] = entry[u'normalized_cell_data']
         params['mods'] = json.dumps({'parameters': mods_parameters})
         ## post
-        with open(filepath, 'rb') as f:
-            file_name = os.path.basename(f.name)
-            params['content_streams'] = json.dumps([{'file_name': file_name}])
-            files = { file_name: f }
-            r = requests.post( URL, data=params, files=files, verify=True )
+        params['content_streams'] = json.dumps([{'file_name': os.path.basename(filepath)}])
+        uploader = ResumableUploader( log_identifier, history_store=HistoryStore(log_identifier) )
+        r = uploader.post_item( URL, params, filepath )
         if r.ok:
             result_dct = r.json()
             if result_dct['post_result'] == u'SUCCESS':